@@ -1,12 +1,22 @@
-from pymongo import MongoClient
-from datetime import datetime
+from bson.codec_options import CodecOptions
+from pymongo import AsyncMongoClient
+from pymongo.errors import BulkWriteError
+from datetime import datetime, timezone
 from typing import List, Optional
 from pydantic import BaseModel
+import asyncio
 import logging
 import os
 
 logger = logging.getLogger(__name__)
 
+# Queued battle writes are flushed with one insert_many as soon as the queue is
+# drained. Only during a burst, when other records were already waiting, does the
+# writer hold the batch open for more, until it reaches this many records or this
+# many seconds have passed since the first one arrived.
+WRITE_BATCH_SIZE = 50
+WRITE_FLUSH_INTERVAL = 0.1
+
 class BattleRecord(BaseModel):
     character1: str
     character2: str
@@ -16,42 +26,152 @@ class BattleRecord(BaseModel):
 
 class Database:
     def __init__(self):
-        logger.info("Initializing MongoDB connection...")
+        mongodb_uri = os.getenv("MONGODB_URI")
+        if not mongodb_uri:
+            raise ValueError("MONGODB_URI environment variable is required")
+        self.mongodb_uri = mongodb_uri
+        # The client is created in connect(), from the running event loop, so
+        # constructing a Database does no I/O and opens no sockets.
+        self.client: Optional[AsyncMongoClient] = None
+        self.db = None
+        self.battles = None
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+
+    async def connect(self):
+        logger.info("Connecting to MongoDB...")
+        logger.info("Using MongoDB URI: %s", self.mongodb_uri)
         try:
-            mongodb_uri = os.getenv("MONGODB_URI")
-            if not mongodb_uri:
-                raise ValueError("MONGODB_URI environment variable is required")
-            logger.info(f"Using MongoDB URI: {mongodb_uri}")
-            self.client = MongoClient(mongodb_uri)
+            self.client = AsyncMongoClient(self.mongodb_uri)
             self.db = self.client["powerscaler"]
-            self.battles = self.db["battles"]
+            # Decode stored BSON dates straight into aware UTC datetimes
+            self.battles = self.db.get_collection(
+                "battles", codec_options=CodecOptions(tz_aware=True, tzinfo=timezone.utc)
+            )
             # Test the connection
-            self.client.admin.command('ping')
+            await self.client.admin.command('ping')
             logger.info("MongoDB connection established successfully")
+            await self._ensure_indexes()
+            self._write_queue = asyncio.Queue()
+            self._writer_task = asyncio.create_task(self._run_writer())
+        except Exception as e:
+            logger.error("Failed to connect to MongoDB: %s", e, exc_info=True)
+            # Don't leave a half-initialized client open behind the failed connect
+            if self.client:
+                await self.client.close()
+                self.client = None
+            raise
+
+    async def _ensure_indexes(self):
+        # create_index is a no-op when the index already exists, so this is safe on every startup.
+        # The timestamp index backs the history sort; the character index backs matchup lookups.
+        await self.battles.create_index([("timestamp", -1)])
+        await self.battles.create_index([("character1", 1), ("character2", 1)])
+        logger.info("MongoDB indexes ensured")
+
+    async def close(self):
+        logger.info("Closing MongoDB connection...")
+        if self._writer_task:
+            # Let the writer flush everything already queued before stopping it
+            await self._write_queue.join()
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+            self._writer_task = None
+        if self.client:
+            await self.client.close()
+            self.client = None
+
+    async def _run_writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._write_queue.get()]
+            deadline = loop.time() + WRITE_FLUSH_INTERVAL
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._write_queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                # A lone record is written right away, so normal traffic never pays the flush interval
+                remaining = deadline - loop.time()
+                if len(batch) == 1 or remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._write_queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self.save_battles([battle for battle, _ in batch])
+            except BulkWriteError as e:
+                # The insert is unordered, so documents without a write error were stored;
+                # only their own callers should see the failure
+                failed = {error["index"] for error in e.details.get("writeErrors", [])}
+                if e.details.get("writeConcernErrors"):
+                    failed = set(range(len(batch)))
+                for index, (_, done) in enumerate(batch):
+                    if done.done():
+                        continue
+                    if index in failed:
+                        done.set_exception(e)
+                    else:
+                        done.set_result(None)
+            except Exception as e:
+                for _, done in batch:
+                    if not done.done():
+                        done.set_exception(e)
+            else:
+                for _, done in batch:
+                    if not done.done():
+                        done.set_result(None)
+            finally:
+                for _ in batch:
+                    self._write_queue.task_done()
+
+    async def save_battle(self, battle: BattleRecord):
+        logger.debug("Saving battle record: %s vs %s", battle.character1, battle.character2)
+        try:
+            if not self._writer_task:
+                await self.save_battles([battle])
+            else:
+                # Hand the record to the batching writer and wait for its flush,
+                # so callers still only return once the record is stored.
+                done = asyncio.get_running_loop().create_future()
+                await self._write_queue.put((battle, done))
+                await done
+            logger.debug("Battle record saved successfully")
         except Exception as e:
-            logger.error(f"Failed to connect to MongoDB: {str(e)}", exc_info=True)
+            logger.error("Failed to save battle record: %s", e, exc_info=True)
             raise
 
-    def save_battle(self, battle: BattleRecord):
-        logger.info(f"Saving battle record: {battle.character1} vs {battle.character2}")
+    async def save_battles(self, battles: List[BattleRecord]):
+        if not battles:
+            return
+        logger.debug("Saving %s battle records in bulk", len(battles))
         try:
-            battle_dict = battle.model_dump()
-            self.battles.insert_one(battle_dict)
-            logger.info("Battle record saved successfully")
+            await self.battles.insert_many([battle.model_dump() for battle in battles], ordered=False)
         except Exception as e:
-            logger.error(f"Failed to save battle record: {str(e)}", exc_info=True)
+            logger.error("Failed to save %s battle records: %s", len(battles), e, exc_info=True)
             raise
 
-    def get_battle_history(self) -> List[BattleRecord]:
-        logger.info("Retrieving battle history...")
+    async def get_battle_history(self, limit: int = 50) -> List[BattleRecord]:
+        logger.debug("Retrieving battle history (limit %s)...", limit)
         try:
-            records = self.battles.find().sort("timestamp", -1)
+            cursor = self.battles.find({}, projection={"_id": 0}).sort("timestamp", -1).limit(limit)
+            records = await cursor.to_list(length=None)
             battle_list = [BattleRecord(**record) for record in records]
-            logger.info(f"Retrieved {len(battle_list)} battle records")
+            logger.debug("Retrieved %s battle records", len(battle_list))
             return battle_list
         except Exception as e:
-            logger.error(f"Failed to retrieve battle history: {str(e)}", exc_info=True)
+            logger.error("Failed to retrieve battle history: %s", e, exc_info=True)
             raise
 
-# Comment out or remove the direct instantiation of db at module level
-# db = Database() 
\ No newline at end of file
+    async def count_battles(self) -> int:
+        # Reads the count from collection metadata instead of scanning documents
+        try:
+            return await self.battles.estimated_document_count()
+        except Exception as e:
+            logger.error("Failed to count battle records: %s", e, exc_info=True)
+            raise
@@ -0,0 +1,44 @@
+from cachetools import TTLCache
+from typing import Any, Awaitable, Callable, Optional
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+def normalize_name(name: str) -> str:
+    """Normalize a character name so trivially different spellings share cache entries."""
+    return name.strip().casefold()
+
+class LLMCache:
+    """In-memory LRU+TTL cache for Gemini response texts, keyed by a hash of model and prompt."""
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 3600):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    @staticmethod
+    def make_key(model: str, prompt: Any) -> str:
+        payload = json.dumps({"model": model, "prompt": prompt}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        cached = self._cache.get(key)
+        if cached is not None:
+            logger.debug("LLM cache hit for key %s", key[:12])
+        return cached
+
+    def set(self, key: str, value: str):
+        self._cache[key] = value
+
+    async def get_or_set(self, key: str, factory: Callable[[], Awaitable[str]]) -> str:
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        value = await factory()
+        # An empty response is never worth replaying, so leave the key free for a retry
+        if value:
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        self._cache.clear()
@@ -1,25 +1,155 @@
-from typing import List, Optional
-from fastapi import FastAPI, HTTPException
+from typing import Any, AsyncIterator, Callable, List, Optional, Set, Tuple
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from google import genai
 import os
-from datetime import datetime
+import asyncio
+import atexit
+import json
+import queue
+from datetime import datetime, timezone
+from pathlib import Path
 import logging
+from contextlib import asynccontextmanager
+from logging.handlers import QueueHandler, QueueListener
 from app.database import Database, BattleRecord
+from app.llm_cache import LLMCache, normalize_name
+from app.static_files import PrecompressedStaticFiles
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging. Records go through a queue so the actual stderr writes happen on
+# the listener's background thread instead of blocking the event loop.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "WARNING").upper()
+_log_queue = queue.SimpleQueue()
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+_log_listener = QueueListener(_log_queue, _log_handler)
+_queue_handler = QueueHandler(_log_queue)
+# QueueHandler pre-formats records; keep that to the bare message so the prefix is added once
+_queue_handler.setFormatter(logging.Formatter("%(message)s"))
+logging.basicConfig(level=LOG_LEVEL, handlers=[_queue_handler])
+_log_listener.start()
+atexit.register(_log_listener.stop)
 logger = logging.getLogger(__name__)
 
+# Path configurations, resolved once at import
+APP_PACKAGE_DIR = Path(__file__).resolve().parent
+BACKEND_BASE_DIR = APP_PACKAGE_DIR.parent
+FRONTEND_DIST_DIR = BACKEND_BASE_DIR / "frontend_dist"
+FRONTEND_ASSETS_DIR = FRONTEND_DIST_DIR / "assets"
+INDEX_HTML_FILE = FRONTEND_DIST_DIR / "index.html"
+
+GEMINI_MODEL = "gemini-2.0-flash-lite"
+GEMINI_TIMEOUT_MS = 30_000
+# The pre-warm only buys a warm TLS connection, so give up on it quickly
+GEMINI_PREWARM_TIMEOUT = 5
+# Bump whenever the fighter prompt or config changes so cached analyses are not reused.
+FIGHTER_PROMPT_VERSION = 1
+# Decode time scales with output length, so cap each analysis; a low temperature
+# keeps repeat matchups close enough that caching their analyses is reasonable.
+FIGHTER_CONFIG = {
+    "max_output_tokens": 600,
+    "temperature": 0.2,
+}
+
+# Prompt templates are plain str.format templates (not f-strings) so the static
+# text is built once at import and only the names/analyses are substituted per request.
+FIGHTER_PROMPT = """
+{c1} is up against {c2}. You are on team {c1}.
+Consider the following, among other things: hax, power vs. fragility, hit‑capability, attrition, special abilities, tactics, narrative.
+write a narrative of what you believe will happen in the battle based on that analysis.
+Explicitly anticipate {c2}'s best argument and battle narrative and explain why it fails inconsistant.
+Anchor necessary claims with at least one concrete, canon feat (e.g. "demolished a mountain in 0.2 s").
+The most important thing here is to identify the most narratively consistent and likely situation to play out.
+do not attempt to qualitatively bring disparate fighters closer in power. If one character is too durable to be hurt by the other, then consider that.
+if one character is too fast to hit the other, than consider that.
+if one character has a special power that has no answer, then consider that.
+consider the scale of attacks that hurt each character and understand if each characters attacks meet that scale (ie blowing up planets)
+if necessary, consider if these ideas are backed up by feats, or canon narrative events
+feel free to chain scale feats of other characters in their verse
+keep points short and sweet. Use bullet points and no fluff
+"""
+
+JUDGMENT_PROMPT = """
+You are the judge of a powerscaling theoretical battle. Take these two arguments and narraties of how a battle will play out and determine who wins and why.
+Here are some potential
+The most important thing here is to identify the most narratively consistent and likely situation to play out.
+do not attempt to qualitatively bring disparate fighters closer in power. If one character is too durable to be hurt by the other, then consider that.
+if one character is too fast to hit the other, than consider that.
+if one character has a special power that has no answer, then consider that.
+consider the scale of attacks that hurt each character and understand if each characters attacks meet that scale (ie blowing up planets)
+if necessary, consider if these ideas are backed up by feats, or canon narrative events
+Here are some other things to consider: 
+• At each step, call out any unsupported or contradictory claims.  
+• Stop as soon as one fighter clearly "outranks" the other.  
+• If neither gains a clear win, note it as a draw or invoke narrative logic as a tie‑breaker.  
+Based on that, who wins and why? Provide detailed, tier‑free reasoning and flag any inconsistency or missing feat evidence.
+keep points short and sweet. Use bullet points and no fluff
+– Analysis for {c1} –  
+{a1}
+– Analysis for {c2} –  
+{a2}
+Output only a JSON object conforming to the Judgment schema.
+The analysis should reflect the most logical analysis. This should be markdown formatted if necessary.
+The narrative to should be a short narrative of the most logical battle. this should be markdown formatted if necessary.
+The winner should be the character that wins the battle.
+"""
+
+# Single-call variant: one request does both fighter analyses and the judgment.
+COMBINED_PROMPT = """
+You are analyzing a powerscaling theoretical battle between {c1} and {c2}. Do three things and return them together.
+1. fighter1_analysis: argue for {c1}, explicitly anticipating {c2}'s best argument and explaining why it fails.
+2. fighter2_analysis: argue for {c2}, explicitly anticipating {c1}'s best argument and explaining why it fails.
+3. judgment: judge the two arguments and determine who wins and why.
+For both analyses, consider among other things: hax, power vs. fragility, hit‑capability, attrition, special abilities, tactics, narrative.
+Anchor necessary claims with at least one concrete, canon feat (e.g. "demolished a mountain in 0.2 s"). Feel free to chain scale feats of other characters in their verse.
+The most important thing here is to identify the most narratively consistent and likely situation to play out.
+do not attempt to qualitatively bring disparate fighters closer in power. If one character is too durable to be hurt by the other, then consider that.
+if one character is too fast to hit the other, than consider that.
+if one character has a special power that has no answer, then consider that.
+consider the scale of attacks that hurt each character and understand if each characters attacks meet that scale (ie blowing up planets)
+if necessary, consider if these ideas are backed up by feats, or canon narrative events
+When judging: call out any unsupported or contradictory claims, stop as soon as one fighter clearly "outranks" the other,
+and if neither gains a clear win, note it as a draw or invoke narrative logic as a tie‑breaker.
+keep points short and sweet. Use bullet points and no fluff
+Output only a JSON object conforming to the CombinedJudgment schema.
+The judgment analysis should reflect the most logical analysis. This should be markdown formatted if necessary.
+The judgment narration should be a short narrative of the most logical battle. this should be markdown formatted if necessary.
+The judgment winner should be the character that wins the battle.
+"""
+
 # Pydantic models
 class Judgment(BaseModel):
     analysis: str
     narration: str
     winner: str
 
+# The judgment carries both an analysis and a narration, so it gets a larger cap;
+# temperature 0 makes it deterministic for a given prompt and thus safe to cache.
+JUDGMENT_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": Judgment,
+    "max_output_tokens": 1500,
+    "temperature": 0,
+}
+
+class CombinedJudgment(BaseModel):
+    fighter1_analysis: str
+    fighter2_analysis: str
+    judgment: Judgment
+
+COMBINED_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": CombinedJudgment,
+    "max_output_tokens": 2 * FIGHTER_CONFIG["max_output_tokens"] + JUDGMENT_CONFIG["max_output_tokens"],
+    "temperature": 0,
+}
+
+def _sse_event(event: str, data) -> str:
+    # JSON-encode the payload so multi-line model output stays on a single data: line
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 class BattleRequest(BaseModel):
     character1: str
     character2: str
@@ -29,52 +159,81 @@ class BattleResult(BaseModel):
     reasoning: str
     timestamp: datetime
 
+# Route dependencies are async because FastAPI sends sync ones through the threadpool
+async def validate_matchup(battle: BattleRequest) -> BattleRequest:
+    """Reject degenerate matchups up front, before any Gemini or database I/O.
+
+    Routes declare this dependency ahead of get_db, so a bad request gets its 400
+    even when the database is unavailable.
+    """
+    character1 = normalize_name(battle.character1)
+    character2 = normalize_name(battle.character2)
+    if not character1 or not character2:
+        raise HTTPException(status_code=400, detail="Both characters must be named.")
+    if character1 == character2:
+        raise HTTPException(status_code=400, detail="Characters must differ.")
+    return battle
+
+async def get_db(request: Request) -> Database:
+    """FastAPI dependency returning the Database the server connected during its lifespan."""
+    db = request.app.state.server.db
+    if db is None:
+        logger.error("Database not initialized for request.")
+        raise HTTPException(status_code=500, detail="Internal server error: Database not ready.")
+    return db
+
 class Server:
     def __init__(self):
-        self.app = FastAPI(title="PowerScaler Battle Arena")
+        self.app = FastAPI(title="PowerScaler Battle Arena", lifespan=self._lifespan)
         self.db: Optional[Database] = None
+        # Builds the Database the lifespan connects; tests swap it to keep startup off MongoDB
+        self.database_factory: Callable[[], Database] = Database
+        self.app.state.server = self
         self.client: Optional[genai.Client] = None
+        self.llm_cache = LLMCache()
+        # Opt in to one combined Gemini call per battle instead of analyses + judgment
+        self.single_call_battle = os.getenv("SINGLE_CALL_BATTLE", "false").lower() in ("1", "true", "yes")
+        self._background_tasks: Set[asyncio.Task] = set()
 
         # Path configurations
-        self.APP_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
-        self.BACKEND_BASE_DIR = os.path.dirname(self.APP_PACKAGE_DIR)
-        self.FRONTEND_DIST_DIR = os.path.join(self.BACKEND_BASE_DIR, "frontend_dist")
-        self.FRONTEND_ASSETS_DIR = os.path.join(self.FRONTEND_DIST_DIR, "assets")
-        self.INDEX_HTML_FILE = os.path.join(self.FRONTEND_DIST_DIR, "index.html")
+        self.APP_PACKAGE_DIR = APP_PACKAGE_DIR
+        self.BACKEND_BASE_DIR = BACKEND_BASE_DIR
+        self.FRONTEND_DIST_DIR = FRONTEND_DIST_DIR
+        self.FRONTEND_ASSETS_DIR = FRONTEND_ASSETS_DIR
+        self.INDEX_HTML_FILE = INDEX_HTML_FILE
 
+        self._load_index_html()
         self._log_path_info()
-        self._configure_gemini_client()
         self._setup_middleware()
         self._setup_static_files()
-        self._register_event_handlers()
         self._register_routes()
 
     def _log_path_info(self):
-        logger.info(f"Expecting Svelte index.html at: {self.INDEX_HTML_FILE}")
-        logger.info(f"Expecting Svelte assets at: {self.FRONTEND_ASSETS_DIR}")
-        if not os.path.isdir(self.FRONTEND_ASSETS_DIR):
-            logger.warning(f"Frontend assets directory NOT FOUND at: {self.FRONTEND_ASSETS_DIR}")
-        if not os.path.isfile(self.INDEX_HTML_FILE):
-            logger.warning(f"Frontend index.html NOT FOUND at: {self.INDEX_HTML_FILE}")
+        logger.info("Expecting Svelte index.html at: %s", self.INDEX_HTML_FILE)
+        logger.info("Expecting Svelte assets at: %s", self.FRONTEND_ASSETS_DIR)
+        if not self._assets_exist:
+            logger.warning("Frontend assets directory NOT FOUND at: %s", self.FRONTEND_ASSETS_DIR)
+        if not self._index_exists:
+            logger.warning("Frontend index.html NOT FOUND at: %s", self.INDEX_HTML_FILE)
+
+    def _load_index_html(self):
+        # The SPA shell never changes while the server runs, so stat and read it once
+        # here instead of touching the filesystem on every request.
+        self._assets_exist = self.FRONTEND_ASSETS_DIR.is_dir()
+        self._index_exists = self.INDEX_HTML_FILE.is_file()
+        self._index_bytes: Optional[bytes] = None
+        if self._index_exists:
+            self._index_bytes = self.INDEX_HTML_FILE.read_bytes()
 
     def _configure_gemini_client(self):
         GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
         if not GEMINI_API_KEY:
             logger.error("GEMINI_API_KEY not found in environment variables")
-            # For tests, this might be an issue if GEMINI_API_KEY is not set and we don't mock early enough
-            # However, our test_battle_endpoint specifically mocks genai.Client, so this block might not run in that test.
-            try:
-                is_pytest_running = "PYTEST_CURRENT_TEST" in os.environ
-            except TypeError: # os.environ might not be fully populated in some restricted test envs
-                is_pytest_running = False
-            if not is_pytest_running: # Only raise if not in a test context where it might be mocked
-                 raise ValueError("GEMINI_API_KEY environment variable is required")
-            else:
-                logger.warning("GEMINI_API_KEY not found, but running in test mode. Assuming genai.Client will be mocked.")
-        if GEMINI_API_KEY: # Proceed if key is found
-            self.client = genai.Client(api_key=GEMINI_API_KEY)
-            logger.info("Gemini API configured successfully")
-        # If no key and not mocked, self.client remains None, handled by route checks
+            raise ValueError("GEMINI_API_KEY environment variable is required")
+        # One client for the whole process: its async transport keeps a pooled
+        # keep-alive connection that every Gemini call reuses.
+        self.client = genai.Client(api_key=GEMINI_API_KEY, http_options={"timeout": GEMINI_TIMEOUT_MS})
+        logger.info("Gemini API configured successfully")
 
     def _setup_middleware(self):
         self.app.add_middleware(
@@ -86,151 +245,250 @@ class Server:
         )
 
     def _setup_static_files(self):
-        self.app.mount("/assets", StaticFiles(directory=self.FRONTEND_ASSETS_DIR), name="svelte-assets")
+        self.app.mount("/assets", PrecompressedStaticFiles(directory=self.FRONTEND_ASSETS_DIR, html=False), name="svelte-assets")
 
-    def _register_event_handlers(self):
-        @self.app.on_event("startup")
-        async def startup_event():
-            self.db = Database()
+    @asynccontextmanager
+    async def _lifespan(self, app: FastAPI):
+        self._configure_gemini_client()
+        # Everything after the Gemini client exists runs under the try, so a failed
+        # startup still closes its transport
+        try:
+            db = self.database_factory()
+            await db.connect()
+            self.db = db
             logger.info("Database initialized and assigned to server instance.")
+            # Pre-warm in the background so a slow Gemini endpoint never holds up startup
+            self._run_in_background(self._prewarm_gemini_client())
+            yield
+        finally:
+            # Let in-flight background saves finish before the client goes away
+            if self._background_tasks:
+                await asyncio.gather(*self._background_tasks, return_exceptions=True)
+            if self.db:
+                await self.db.close()
+                self.db = None
+            if self.client:
+                await self.client.aio.aclose()
+                self.client = None
+
+    async def _prewarm_gemini_client(self):
+        """Make one cheap metadata request so the first battle reuses an established TLS connection."""
+        if not self.client:
+            return
+        try:
+            await asyncio.wait_for(self.client.aio.models.get(model=GEMINI_MODEL), GEMINI_PREWARM_TIMEOUT)
+            logger.info("Gemini client pre-warmed")
+        except Exception as e:
+            logger.warning("Gemini client pre-warm failed: %r", e)
 
     async def serve_spa(self, full_path: str):
-        if not os.path.isfile(self.INDEX_HTML_FILE):
-            logger.error(f"SPA index.html cannot be served, file not found at: {self.INDEX_HTML_FILE}")
+        if not self._index_exists:
+            logger.error("SPA index.html cannot be served, file not found at: %s", self.INDEX_HTML_FILE)
             raise HTTPException(status_code=404, detail="Client application not found.")
-        return FileResponse(self.INDEX_HTML_FILE)
+        return Response(content=self._index_bytes, media_type="text/html")
 
-    async def create_battle(self, battle: BattleRequest):
-        logger.info(f"Starting battle between {battle.character1} and {battle.character2}")
-        
+    def _fighter_cache_key(self, fighter: str, opponent: str) -> str:
+        return LLMCache.make_key(GEMINI_MODEL, {
+            "version": FIGHTER_PROMPT_VERSION,
+            "fighter": normalize_name(fighter),
+            "opponent": normalize_name(opponent),
+        })
+
+    async def _generate_text(self, cache_key: str, validate: Optional[Callable[[str], Any]] = None, **kwargs) -> str:
+        """Return the text of a Gemini response, served from the LLM cache when possible.
+
+        validate runs before the text is cached, so a truncated or malformed
+        response raises instead of being replayed on every retry.
+        """
+        async def call() -> str:
+            response = await self.client.aio.models.generate_content(model=GEMINI_MODEL, **kwargs)
+            if validate and response.text:
+                validate(response.text)
+            return response.text
+        return await self.llm_cache.get_or_set(cache_key, call)
+
+    def _check_ready(self):
         if not self.client:
              logger.error("Gemini client not initialized for battle.")
              raise HTTPException(status_code=500, detail="Internal server error: Gemini client not ready.")
-        if not self.db:
-             logger.error("Database not initialized for battle.")
-             raise HTTPException(status_code=500, detail="Internal server error: Database not ready.")
+
+    async def _analyze_fighters(self, battle: BattleRequest) -> Tuple[str, str]:
+        logger.debug("Analyzing %s and %s concurrently...", battle.character1, battle.character2)
+        fighter1_prompt = FIGHTER_PROMPT.format(c1=battle.character1, c2=battle.character2)
+        fighter2_prompt = FIGHTER_PROMPT.format(c1=battle.character2, c2=battle.character1)
+        fighter1_key = self._fighter_cache_key(battle.character1, battle.character2)
+        fighter2_key = self._fighter_cache_key(battle.character2, battle.character1)
+        # The two fighter analyses are independent, so run them in parallel;
+        # only the judgment needs both results.
+        fighter1_text, fighter2_text = await asyncio.gather(
+            self._generate_text(fighter1_key, contents=fighter1_prompt, config=FIGHTER_CONFIG),
+            self._generate_text(fighter2_key, contents=fighter2_prompt, config=FIGHTER_CONFIG),
+        )
+        logger.debug("CREATE_BATTLE: Fighter 1 analysis complete. Text: %s...", fighter1_text[:50])
+        logger.debug("CREATE_BATTLE: Fighter 2 analysis complete. Text: %s...", fighter2_text[:50])
+        return fighter1_text, fighter2_text
+
+    def _battle_record(self, battle: BattleRequest, result: BattleResult) -> BattleRecord:
+        return BattleRecord(
+            character1=battle.character1,
+            character2=battle.character2,
+            winner=result.winner,
+            reasoning=result.reasoning,
+            timestamp=result.timestamp
+        )
+
+    async def _three_call_judgment(self, battle: BattleRequest) -> Judgment:
+        fighter1_text, fighter2_text = await self._analyze_fighters(battle)
+
+        logger.debug("Getting final judgment...")
+        judgment_prompt = JUDGMENT_PROMPT.format(
+            c1=battle.character1, c2=battle.character2, a1=fighter1_text, a2=fighter2_text
+        )
+        judgment_text = await self._generate_text(
+            LLMCache.make_key(GEMINI_MODEL, judgment_prompt),
+            validate=Judgment.model_validate_json,
+            contents=judgment_prompt,
+            config=JUDGMENT_CONFIG
+        )
+        logger.debug("CREATE_BATTLE: Judgment response complete. Text: %s...", judgment_text[:50])
+        return Judgment.model_validate_json(judgment_text)
+
+    async def _single_call_judgment(self, battle: BattleRequest) -> Judgment:
+        logger.debug("Getting combined analyses and judgment...")
+        combined_prompt = COMBINED_PROMPT.format(c1=battle.character1, c2=battle.character2)
+        combined_text = await self._generate_text(
+            LLMCache.make_key(GEMINI_MODEL, combined_prompt),
+            validate=CombinedJudgment.model_validate_json,
+            contents=combined_prompt,
+            config=COMBINED_CONFIG
+        )
+        logger.debug("CREATE_BATTLE: Combined response complete. Text: %s...", combined_text[:50])
+        return CombinedJudgment.model_validate_json(combined_text).judgment
+
+    async def create_battle(self, battle: BattleRequest = Depends(validate_matchup), db: Database = Depends(get_db)):
+        logger.debug("Starting battle between %s and %s", battle.character1, battle.character2)
+        self._check_ready()
 
         try:
-            logger.info("CREATE_BATTLE: Entered try block")
-            logger.info(f"Analyzing {battle.character1}...")
-            fighter1_analysis = self.client.models.generate_content(
-                model="gemini-2.0-flash-lite",
-                contents=f"""
-                    {battle.character1} is up against {battle.character2}. You are on team {battle.character1}.
-                    Consider the following, among other things: hax, power vs. fragility, hit‑capability, attrition, special abilities, tactics, narrative.
-                    write a narrative of what you believe will happen in the battle based on that analysis.
-                    Explicitly anticipate {battle.character2}'s best argument and battle narrative and explain why it fails inconsistant.
-                    Anchor necessary claims with at least one concrete, canon feat (e.g. "demolished a mountain in 0.2 s").
-                    The most important thing here is to identify the most narratively consistent and likely situation to play out.
-                    do not attempt to qualitatively bring disparate fighters closer in power. If one character is too durable to be hurt by the other, then consider that.
-                    if one character is too fast to hit the other, than consider that.
-                    if one character has a special power that has no answer, then consider that.
-                    consider the scale of attacks that hurt each character and understand if each characters attacks meet that scale (ie blowing up planets)
-                    if necessary, consider if these ideas are backed up by feats, or canon narrative events
-                    feel free to chain scale feats of other characters in their verse
-                    keep points short and sweet. Use bullet points and no fluff
-                """
-            )
-            logger.info(f"CREATE_BATTLE: Fighter 1 analysis complete. Text: {fighter1_analysis.text[:50]}...")
-
-            logger.info(f"Analyzing {battle.character2}...")
-            fighter2_analysis = self.client.models.generate_content(
-                model="gemini-2.0-flash-lite",
-                contents=f"""
-                    {battle.character2} is up against {battle.character1}. You are on team {battle.character2}.
-                    Consider the following, among other things: hax, power vs. fragility, hit‑capability, attrition, special abilities, tactics, narrative.
-                    write a narrative of what you believe will happen in the battle based on that analysis.
-                    Explicitly anticipate {battle.character1}'s best argument and battle narrative and explain why it fails inconsistant.
-                    Anchor necessary claims with at least one concrete, canon feat (e.g. "demolished a mountain in 0.2 s").
-                    The most important thing here is to identify the most narratively consistent and likely situation to play out.
-                    do not attempt to qualitatively bring disparate fighters closer in power. If one character is too durable to be hurt by the other, then consider that.
-                    if one character is too fast to hit the other, than consider that.
-                    if one character has a special power that has no answer, then consider that.
-                    consider the scale of attacks that hurt each character and understand if each characters attacks meet that scale (ie blowing up planets)
-                    if necessary, consider if these ideas are backed up by feats, or canon narrative events
-                    feel free to chain scale feats of other characters in their verse
-                    keep points short and sweet. Use bullet points and no fluff
-                """
-            )
-            logger.info(f"CREATE_BATTLE: Fighter 2 analysis complete. Text: {fighter2_analysis.text[:50]}...")
-
-            logger.info("Getting final judgment...")
-            judgment_response = self.client.models.generate_content(
-                model="gemini-2.0-flash-lite",
-                contents=f"""    
-                    You are the judge of a powerscaling theoretical battle. Take these two arguments and narraties of how a battle will play out and determine who wins and why.
-                    Here are some potential
-                    The most important thing here is to identify the most narratively consistent and likely situation to play out.
-                    do not attempt to qualitatively bring disparate fighters closer in power. If one character is too durable to be hurt by the other, then consider that.
-                    if one character is too fast to hit the other, than consider that.
-                    if one character has a special power that has no answer, then consider that.
-                    consider the scale of attacks that hurt each character and understand if each characters attacks meet that scale (ie blowing up planets)
-                    if necessary, consider if these ideas are backed up by feats, or canon narrative events
-                    Here are some other things to consider: 
-                    • At each step, call out any unsupported or contradictory claims.  
-                    • Stop as soon as one fighter clearly "outranks" the other.  
-                    • If neither gains a clear win, note it as a draw or invoke narrative logic as a tie‑breaker.  
-                    Based on that, who wins and why? Provide detailed, tier‑free reasoning and flag any inconsistency or missing feat evidence.
-                    keep points short and sweet. Use bullet points and no fluff
-                    – Analysis for {battle.character1} –  
-                    {fighter1_analysis.text}
-                    – Analysis for {battle.character2} –  
-                    {fighter2_analysis.text}
-                    Output only a JSON object conforming to the Judgment schema.
-                    The analysis should reflect the most logical analysis. This should be markdown formatted if necessary.
-                    The narrative to should be a short narrative of the most logical battle. this should be markdown formatted if necessary.
-                    The winner should be the character that wins the battle.
-                """,
-                config={
-                    "response_mime_type": "application/json",
-                    "response_schema": Judgment,
-                }
+            logger.debug("CREATE_BATTLE: Entered try block")
+            if self.single_call_battle:
+                judgment_result = await self._single_call_judgment(battle)
+            else:
+                judgment_result = await self._three_call_judgment(battle)
+            logger.debug("CREATE_BATTLE: Judgment parsed. Winner: %s", judgment_result.winner)
+
+            result = BattleResult(
+                winner=judgment_result.winner,
+                reasoning=judgment_result.analysis,
+                timestamp=datetime.now(timezone.utc)
             )
-            logger.info(f"CREATE_BATTLE: Judgment response complete. Text: {judgment_response.text[:50]}...")
+            logger.debug("CREATE_BATTLE: BattleResult created.")
+
+            logger.debug("Saving battle record to database...")
+            await db.save_battle(self._battle_record(battle, result))
+            logger.debug("CREATE_BATTLE: Battle record saved.")
+
+            return result
+        except Exception as e:
+            logger.error("CREATE_BATTLE: Error in battle creation: %s", e, exc_info=True)
+            raise HTTPException(status_code=500, detail=str(e))
+
+    async def stream_battle(self, battle: BattleRequest = Depends(validate_matchup), db: Database = Depends(get_db)):
+        """Like create_battle, but streams the judgment to the client as server-sent events."""
+        logger.debug("Starting streamed battle between %s and %s", battle.character1, battle.character2)
+        self._check_ready()
+
+        # Run the analyses before the response starts so failures still surface as a plain 500
+        try:
+            fighter1_text, fighter2_text = await self._analyze_fighters(battle)
+        except Exception as e:
+            logger.error("STREAM_BATTLE: Error analyzing fighters: %s", e, exc_info=True)
+            raise HTTPException(status_code=500, detail=str(e))
+
+        judgment_prompt = JUDGMENT_PROMPT.format(
+            c1=battle.character1, c2=battle.character2, a1=fighter1_text, a2=fighter2_text
+        )
+        return StreamingResponse(
+            self._stream_judgment(battle, judgment_prompt, db),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache"},
+        )
 
-            judgment_result = Judgment.model_validate_json(judgment_response.text)
-            logger.info(f"CREATE_BATTLE: Judgment parsed. Winner: {judgment_result.winner}")
+    async def _stream_judgment(self, battle: BattleRequest, judgment_prompt: str, db: Database) -> AsyncIterator[str]:
+        cache_key = LLMCache.make_key(GEMINI_MODEL, judgment_prompt)
+        try:
+            cached_text = self.llm_cache.get(cache_key)
+            if cached_text is not None:
+                judgment_text = cached_text
+                yield _sse_event("chunk", judgment_text)
+            else:
+                chunks = []
+                stream = await self.client.aio.models.generate_content_stream(
+                    model=GEMINI_MODEL,
+                    contents=judgment_prompt,
+                    config=JUDGMENT_CONFIG
+                )
+                async for chunk in stream:
+                    if chunk.text:
+                        chunks.append(chunk.text)
+                        yield _sse_event("chunk", chunk.text)
+                judgment_text = "".join(chunks)
 
+            judgment_result = Judgment.model_validate_json(judgment_text)
+            # Only cache a judgment that parsed, so a truncated stream isn't replayed on retry
+            if cached_text is None:
+                self.llm_cache.set(cache_key, judgment_text)
+            logger.debug("STREAM_BATTLE: Judgment parsed. Winner: %s", judgment_result.winner)
             result = BattleResult(
                 winner=judgment_result.winner,
                 reasoning=judgment_result.analysis,
-                timestamp=datetime.now()
+                timestamp=datetime.now(timezone.utc)
             )
-            logger.info("CREATE_BATTLE: BattleResult created.")
-
-            logger.info("Saving battle record to database...")
-            battle_record = BattleRecord(
-                character1=battle.character1,
-                character2=battle.character2,
-                winner=result.winner,
-                reasoning=result.reasoning,
-                timestamp=result.timestamp
-            )
-            self.db.save_battle(battle_record)
-            logger.info("CREATE_BATTLE: Battle record saved.")
+            # Don't hold back the final event on the database write
+            self._run_in_background(db.save_battle(self._battle_record(battle, result)))
+            yield _sse_event("result", result.model_dump(mode="json"))
+        except Exception as e:
+            logger.error("STREAM_BATTLE: Error streaming judgment: %s", e, exc_info=True)
+            yield _sse_event("error", {"detail": str(e)})
 
-            return result
+    def _run_in_background(self, coro):
+        # Keep a reference so the task isn't garbage collected before it finishes
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        task.add_done_callback(self._log_background_failure)
+
+    @staticmethod
+    def _log_background_failure(task: asyncio.Task):
+        # Nobody awaits these tasks, so retrieve the exception here rather than at GC time
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            logger.error("Background task failed: %s", exc, exc_info=exc)
+
+    async def get_battle_history(self, limit: int = Query(50, ge=1, le=500), db: Database = Depends(get_db)):
+        logger.debug("Retrieving battle history...")
+        try:
+            return await db.get_battle_history(limit=limit)
         except Exception as e:
-            logger.error(f"CREATE_BATTLE: Error in battle creation: {str(e)}", exc_info=True)
+            logger.error("Error retrieving battle history: %s", e, exc_info=True)
             raise HTTPException(status_code=500, detail=str(e))
 
-    async def get_battle_history(self):
-        if not self.db:
-             logger.error("Database not initialized for battle history.")
-             raise HTTPException(status_code=500, detail="Internal server error: Database not ready.")
-        logger.info("Retrieving battle history...")
+    async def count_battles(self, db: Database = Depends(get_db)):
         try:
-            history = self.db.get_battle_history()
-            logger.info(f"Retrieved {len(history)} battle records")
-            return history
+            return {"count": await db.count_battles()}
         except Exception as e:
-            logger.error(f"Error retrieving battle history: {str(e)}", exc_info=True)
+            logger.error("Error counting battles: %s", e, exc_info=True)
             raise HTTPException(status_code=500, detail=str(e))
 
     def _register_routes(self):
-        self.app.add_api_route("/{full_path:path}", self.serve_spa, methods=["GET"])
+        # Routes match in registration order, so the API must come before the SPA catch-all
         self.app.add_api_route("/battle", self.create_battle, methods=["POST"])
+        self.app.add_api_route("/battle/stream", self.stream_battle, methods=["POST"])
         self.app.add_api_route("/battle/history", self.get_battle_history, methods=["GET"])
+        self.app.add_api_route("/battle/history/count", self.count_battles, methods=["GET"])
+        self.app.add_api_route("/{full_path:path}", self.serve_spa, methods=["GET"])
 
 # Instantiate the server and expose the app for Uvicorn
 _server_instance = Server()
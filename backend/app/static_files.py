@@ -0,0 +1,64 @@
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
+from starlette.types import Scope
+from typing import Set
+import mimetypes
+import os
+import re
+
+# Vite emits content-hashed bundles such as "index-BOwwHLTA.js"; their contents never
+# change under the same name, so browsers may cache them forever. Match exactly Vite's
+# 8-character base64url hash, and require a digit or uppercase letter in it, so dashed
+# names like "apple-touch-icon.png" or "app-settings.css" aren't cached as immutable.
+HASHED_ASSET_RE = re.compile(r"-(?=[a-z_-]*[A-Z0-9])[A-Za-z0-9_-]{8}\.\w+$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Precompressed variants written next to each asset at build time, in order of preference.
+PRECOMPRESSED_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+def _accepted_encodings(header: str) -> Set[str]:
+    """Content codings listed in an Accept-Encoding header, minus any refused with q=0."""
+    accepted = set()
+    for part in header.split(","):
+        coding, *params = (piece.strip() for piece in part.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding.lower())
+    return accepted
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves .br/.gz siblings when the client accepts them and marks hashed assets immutable."""
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        accepted = _accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        response = None
+        for encoding, suffix in PRECOMPRESSED_ENCODINGS:
+            if encoding not in accepted:
+                continue
+            try:
+                response = await super().get_response(path + suffix, scope)
+            except HTTPException:
+                continue
+            # The body is the compressed file, but the type is that of the original asset
+            response.headers["content-encoding"] = encoding
+            media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+            if media_type.startswith("text/"):
+                media_type += "; charset=utf-8"
+            response.headers["content-type"] = media_type
+            break
+        if response is None:
+            response = await super().get_response(path, scope)
+
+        response.headers["vary"] = "Accept-Encoding"
+        if HASHED_ASSET_RE.search(os.path.basename(path)):
+            response.headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+        return response
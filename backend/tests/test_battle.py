@@ -1,111 +1,270 @@
+import asyncio
+import functools
+import json
+import os
 import pytest
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
-from datetime import datetime
+from unittest.mock import patch, MagicMock, AsyncMock
+from types import SimpleNamespace
+from datetime import datetime, timedelta
 
+from app.database import Database
 # Models are needed for payload creation/assertion
-from app.main import Judgment, BattleRequest, BattleResult 
+from app.main import Judgment, CombinedJudgment, Server, app, get_db, _server_instance
 
 # Global mock instance for the database
-# This single instance will be returned by the mocked Database constructor
-db_mock_instance = MagicMock()
-
-# Patch the source Database class. When app.main.Server calls Database(), 
-# it should get this mock if the import resolves to the patched version.
-# However, we will also directly set _server_instance.db for robustness in tests.
-@patch('app.database.Database', return_value=db_mock_instance)
-def get_test_client_and_setup_db_mock(mock_db_class_at_source):
-    """Imports app, directly sets the .db attribute on the server instance, and returns TestClient."""
-    from app.main import _server_instance # Get the actual instance
-    from app.main import app             # Get the FastAPI app object
-
-    # Directly assign the mock instance to the server's db attribute.
-    # This ensures that route handlers using self.db see the mock.
-    _server_instance.db = db_mock_instance
-    
-    # The app's startup event @app.on_event("startup") self.db = Database() will still run
-    # when TestClient initializes. If app.database.Database is correctly patched, it will assign
-    # db_mock_instance again. Direct assignment above is a more forceful way for tests.
-    
-    return TestClient(app)
+# Every route receives it through the get_db override, so no real connection is ever made.
+# The spec turns Database's coroutine methods into AsyncMocks and rejects unknown attributes.
+db_mock_instance = MagicMock(spec=Database)
+
+# Fixed timestamp for canned history records; reads decode to aware UTC datetimes, so it carries an offset
+_FROZEN_TS = "2024-01-01T00:00:00+00:00"
+
+# Battle requests are posted as pre-encoded bytes, so httpx doesn't re-serialize them per call
+_JSON_HEADERS = {"content-type": "application/json"}
+
+@functools.lru_cache(maxsize=None)
+def _judgment_json(analysis: str, narration: str, winner: str) -> str:
+    """Serialized Judgment payload, built once per distinct payload across parametrized cases."""
+    return Judgment(analysis=analysis, narration=narration, winner=winner).model_dump_json()
+
+@functools.lru_cache(maxsize=None)
+def _battle_payload(character1: str, character2: str) -> bytes:
+    """Encoded battle request body, built once per matchup."""
+    return json.dumps({"character1": character1, "character2": character2}).encode()
+
+@pytest.fixture(scope="session")
+def _gemini_patch():
+    """Patch the Gemini client constructor once for the session instead of per test."""
+    with patch('app.main.genai.Client') as m:
+        m.return_value.aio.models.get = AsyncMock()
+        m.return_value.aio.aclose = AsyncMock()
+        m.return_value.aio.models.generate_content = AsyncMock()
+        m.return_value.aio.models.generate_content_stream = AsyncMock()
+        yield m
+
+@pytest.fixture(scope="session")
+def client(_gemini_patch):
+    """One TestClient for the whole session; entering it runs the app lifespan exactly once.
+
+    The lifespan connects a throwaway Database stub from the server's database_factory;
+    routes only ever see db_mock_instance, through the get_db override installed here
+    and removed on teardown. Every test shares
+    this client, so tests that need a different override must restore it themselves
+    (e.g. with patch.dict) rather than leave app.dependency_overrides changed.
+    """
+    app.dependency_overrides[get_db] = lambda: db_mock_instance
+    try:
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}), \
+                patch.object(_server_instance, "database_factory", lambda: MagicMock(spec=Database)), \
+                TestClient(app, base_url="http://testserver") as c:
+            yield c
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+
+@pytest.fixture
+def db_mock():
+    """Reset call state on the database methods the routes use before each test."""
+    db_mock_instance.save_battle.reset_mock()
+    db_mock_instance.get_battle_history.reset_mock()
+    db_mock_instance.count_battles.reset_mock()
+    yield db_mock_instance
+
+@pytest.fixture
+def gemini_mock(client):
+    """The Gemini client mock built during the lifespan, reset and with an empty LLM cache so every call reaches it."""
+    _server_instance.llm_cache.clear()
+    models = _server_instance.client.aio.models
+    models.generate_content.reset_mock(return_value=True, side_effect=True)
+    models.generate_content_stream.reset_mock(return_value=True, side_effect=True)
+    yield _server_instance.client
 
-class TestBattleRoutes:
+def test_root(client):
+    response = client.get("/")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/html")
+
+@pytest.mark.parametrize("character1,character2,expected_winner,expected_reasoning", [
+    ("Character A", "Character B", "Character A", "Mocked final analysis for judgment"),
+    ("X", "Y", "Y", "Y outpaces X"),
+    ("Saitama", "Goku", "Draw", "Neither fighter gains a clear win"),
+    ("  Goku ", "Vegeta", "  Goku ", "Whitespace is passed through untouched"),
+    ("孫悟空", "Superman", "孫悟空", "Unicode names survive the round trip"),
+])
+def test_battle_endpoint(client, db_mock, gemini_mock, character1, character2, expected_winner, expected_reasoning):
+    # Mock responses for the three calls to generate_content
+    # Production code only reads .text, so plain namespaces stand in for the responses
+    mock_fighter1_analysis_response = SimpleNamespace(text="Fighter 1 analysis text.")
+    mock_fighter2_analysis_response = SimpleNamespace(text="Fighter 2 analysis text.")
+    final_judgment_mock_response = SimpleNamespace(text=_judgment_json(
+        expected_reasoning, "Mocked final narration for judgment", expected_winner
+    ))
+
+    # Set up side_effect to return these in order (both analyses are gathered before the judgment)
+    gemini_mock.aio.models.generate_content.side_effect = [
+        mock_fighter1_analysis_response,
+        mock_fighter2_analysis_response,
+        final_judgment_mock_response
+    ]
+
+    response = client.post("/battle", content=_battle_payload(character1, character2), headers=_JSON_HEADERS)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["winner"] == expected_winner
+    # Reasoning comes from the final judgment's analysis field
+    assert data["reasoning"] == expected_reasoning
+    # Timestamps are aware UTC datetimes, not naive local time
+    assert datetime.fromisoformat(data["timestamp"]).utcoffset() == timedelta(0)
     
-    def setup_method(self, method):
-        """Reset the mock before each test and get a fresh client."""
-        db_mock_instance.reset_mock() # Reset all interactions on the mock
-        # Re-initialize specific method mocks if they were set globally on db_mock_instance by a previous test
-        # For example, if a test did db_mock_instance.save_battle = MagicMock(), clear it or re-assign.
-        # Often, it's better to assign method mocks within each test for clarity.
-        self.client = get_test_client_and_setup_db_mock()
-
-    def test_root(self):
-        response = self.client.get("/")
-        assert response.status_code == 200
-        assert response.headers["content-type"].startswith("text/html")
-
-    @patch('app.main.genai.Client')
-    def test_battle_endpoint(self, mock_gemini_client_constructor):
-        mock_gemini_instance = MagicMock()
-        mock_gemini_client_constructor.return_value = mock_gemini_instance
-        
-        # Mock responses for the three calls to generate_content
-        mock_fighter1_analysis_response = MagicMock()
-        mock_fighter1_analysis_response.text = "Fighter 1 analysis text."
-
-        mock_fighter2_analysis_response = MagicMock()
-        mock_fighter2_analysis_response.text = "Fighter 2 analysis text."
-
-        mock_judgment_payload = {
-            "analysis": "Mocked final analysis for judgment",
-            "narration": "Mocked final narration for judgment",
-            "winner": "Character A" # This is what we expect
+    assert gemini_mock.aio.models.generate_content.await_count == 3
+    db_mock.save_battle.assert_awaited_once()
+    saved = db_mock.save_battle.await_args.args[0]
+    assert (saved.character1, saved.character2, saved.winner) == (character1, character2, expected_winner)
+    assert saved.timestamp.tzinfo is not None
+
+def test_battle_retries_truncated_judgment(client, db_mock, gemini_mock):
+    judgment_json = _judgment_json("Retried analysis", "Retried narration", "Character B")
+    gemini_mock.aio.models.generate_content.side_effect = [
+        SimpleNamespace(text="Fighter 1 analysis text."),
+        SimpleNamespace(text="Fighter 2 analysis text."),
+        SimpleNamespace(text=judgment_json[:20]),
+        SimpleNamespace(text=judgment_json),
+    ]
+    payload = _battle_payload("Character A", "Character B")
+
+    assert client.post("/battle", content=payload, headers=_JSON_HEADERS).status_code == 500
+    # The analyses come from the cache, but the truncated judgment was never cached
+    response = client.post("/battle", content=payload, headers=_JSON_HEADERS)
+    assert response.status_code == 200
+    assert response.json()["winner"] == "Character B"
+    assert gemini_mock.aio.models.generate_content.await_count == 4
+
+def test_battle_endpoint_single_call(client, db_mock, gemini_mock):
+    combined_response = SimpleNamespace(text=CombinedJudgment(
+        fighter1_analysis="Fighter 1 analysis text.",
+        fighter2_analysis="Fighter 2 analysis text.",
+        judgment=Judgment(analysis="Combined analysis", narration="Combined narration", winner="Character B"),
+    ).model_dump_json())
+    gemini_mock.aio.models.generate_content.return_value = combined_response
+
+    with patch.object(_server_instance, "single_call_battle", True):
+        response = client.post("/battle", content=_battle_payload("Character A", "Character B"), headers=_JSON_HEADERS)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["winner"] == "Character B"
+    assert data["reasoning"] == "Combined analysis"
+    gemini_mock.aio.models.generate_content.assert_awaited_once()
+    db_mock.save_battle.assert_awaited_once()
+
+def test_battle_rejects_identical_characters(client, db_mock, gemini_mock):
+    for endpoint in ("/battle", "/battle/stream"):
+        response = client.post(endpoint, content=_battle_payload("Goku", "  goku "), headers=_JSON_HEADERS)
+        assert response.status_code == 400
+
+    response = client.post("/battle", content=_battle_payload("Goku", "   "), headers=_JSON_HEADERS)
+    assert response.status_code == 400
+    gemini_mock.aio.models.generate_content.assert_not_called()
+
+def test_battle_validates_before_database(client, gemini_mock):
+    async def database_unavailable():
+        raise HTTPException(status_code=500, detail="Internal server error: Database not ready.")
+
+    # Matchup validation must not depend on the database being reachable
+    with patch.dict(app.dependency_overrides, {get_db: database_unavailable}):
+        for endpoint in ("/battle", "/battle/stream"):
+            response = client.post(endpoint, content=_battle_payload("Goku", "goku"), headers=_JSON_HEADERS)
+            assert response.status_code == 400
+        response = client.post("/battle", content=_battle_payload("Goku", "  "), headers=_JSON_HEADERS)
+        assert response.status_code == 400
+
+def test_failed_startup_closes_gemini_client():
+    server = Server()
+    failing_db = MagicMock(spec=Database)
+    failing_db.connect.side_effect = ConnectionError("server selection timeout")
+    server.database_factory = lambda: failing_db
+
+    with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}), \
+            patch('app.main.genai.Client') as gemini_constructor:
+        gemini_constructor.return_value.aio.aclose = AsyncMock()
+        with pytest.raises(ConnectionError):
+            with TestClient(server.app):
+                pass
+
+    gemini_constructor.return_value.aio.aclose.assert_awaited_once()
+    assert server.client is None
+
+def test_background_task_failure_is_logged(caplog):
+    server = Server()
+
+    async def failing_save():
+        raise RuntimeError("write failed")
+
+    async def run():
+        server._run_in_background(failing_save())
+        await asyncio.gather(*server._background_tasks, return_exceptions=True)
+
+    asyncio.run(run())
+
+    assert "Background task failed: write failed" in caplog.text
+
+def test_battle_history(client, db_mock):
+    mock_history_data = [
+        {
+            "character1": "Test1", "character2": "Test2", "winner": "Test1", 
+            "reasoning": "Reason", "timestamp": datetime.fromisoformat(_FROZEN_TS)
         }
-        final_judgment_mock_response = MagicMock()
-        final_judgment_mock_response.text = Judgment(**mock_judgment_payload).model_dump_json()
-
-        # Set up side_effect to return these in order
-        mock_gemini_instance.models.generate_content.side_effect = [
-            mock_fighter1_analysis_response,
-            mock_fighter2_analysis_response,
-            final_judgment_mock_response
-        ]
-
-        db_mock_instance.save_battle = MagicMock()
-
-        battle_payload = {"character1": "Character A", "character2": "Character B"}
-        response = self.client.post("/battle", json=battle_payload)
-
-        assert response.status_code == 200
-        data = response.json()
-        assert data["winner"] == "Character A"
-        # Update expected reasoning if it comes from the final judgment's analysis field
-        assert data["reasoning"] == "Mocked final analysis for judgment"
-        assert "timestamp" in data
-        
-        assert mock_gemini_instance.models.generate_content.call_count == 3
-        db_mock_instance.save_battle.assert_called_once()
-
-    def test_battle_history(self):
-        mock_history_data = [
-            {
-                "character1": "Test1", "character2": "Test2", "winner": "Test1", 
-                "reasoning": "Reason", "timestamp": datetime.now().isoformat()
-            }
-        ]
-        # Configure the behavior of methods on our global db_mock_instance for this test
-        db_mock_instance.get_battle_history = MagicMock(return_value=mock_history_data)
-
-        response = self.client.get("/battle/history")
-        assert response.status_code == 200
-        data = response.json()
-        
-        assert isinstance(data, list)
-        assert len(data) == 1
-        assert data[0]["winner"] == "Test1"
-        db_mock_instance.get_battle_history.assert_called_once() # Check the global mock instance
+    ]
+    # Configure the behavior of methods on our global db_mock_instance for this test
+    db_mock.get_battle_history.return_value = mock_history_data
+
+    response = client.get("/battle/history")
+    assert response.status_code == 200
+    data = response.json()
+    
+    assert isinstance(data, list)
+    assert len(data) == 1
+    assert data[0]["winner"] == "Test1"
+    assert data[0]["timestamp"] == _FROZEN_TS
+    db_mock.get_battle_history.assert_awaited_once_with(limit=50) # Check the global mock instance
+
+def test_battle_history_count(client, db_mock):
+    db_mock.count_battles.return_value = 42
+
+    response = client.get("/battle/history/count")
+    assert response.status_code == 200
+    assert response.json() == {"count": 42}
+    db_mock.count_battles.assert_awaited_once()
+
+def test_battle_stream_endpoint(client, db_mock, gemini_mock):
+    mock_fighter1_analysis_response = SimpleNamespace(text="Fighter 1 analysis text.")
+    mock_fighter2_analysis_response = SimpleNamespace(text="Fighter 2 analysis text.")
+    gemini_mock.aio.models.generate_content.side_effect = [
+        mock_fighter1_analysis_response,
+        mock_fighter2_analysis_response
+    ]
+
+    # Split the judgment JSON across two chunks to check they are reassembled
+    judgment_json = _judgment_json("Streamed analysis", "Streamed narration", "Character B")
+    async def judgment_stream():
+        for part in (judgment_json[:10], judgment_json[10:]):
+            yield SimpleNamespace(text=part)
+    gemini_mock.aio.models.generate_content_stream.return_value = judgment_stream()
+
+    response = client.post("/battle/stream", content=_battle_payload("Character A", "Character B"), headers=_JSON_HEADERS)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block.split("\n") for block in response.text.strip().split("\n\n")]
+    assert [lines[0] for lines in events] == ["event: chunk", "event: chunk", "event: result"]
+    result = json.loads(events[-1][1][len("data: "):])
+    assert result["winner"] == "Character B"
+    assert result["reasoning"] == "Streamed analysis"
+    db_mock.save_battle.assert_called_once()
 
 # To run these tests, ensure pytest and necessary mock libraries are installed.
-# The @patch decorator at the class level applies to all methods in the class.
-# Each test method will receive mock_db_class as an argument if it needs to interact with the class mock directly.
-# The global db_mock is the instance that will be returned by Database() calls within the app. 
\ No newline at end of file
+# The session-scoped client fixture overrides get_db to hand db_mock_instance to every route, and swaps
+# the server's database_factory so the lifespan never builds a real Database. It depends on _gemini_patch,
+# so the server holds a mocked Gemini client.
@@ -0,0 +1,87 @@
+import asyncio
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+from pymongo.errors import BulkWriteError
+import pytest
+
+from app.database import BattleRecord, Database
+
+def _record(winner: str) -> BattleRecord:
+    return BattleRecord(
+        character1="A", character2="B", winner=winner, reasoning="Reason", timestamp=datetime(2024, 1, 1)
+    )
+
+def _make_db():
+    """A Database plus the mocked Mongo client and battles collection its connect() will use."""
+    client = MagicMock(close=AsyncMock())
+    client.admin.command = AsyncMock()
+    battles = MagicMock(create_index=AsyncMock(), insert_many=AsyncMock())
+    client.__getitem__.return_value.get_collection.return_value = battles
+    with patch.dict("os.environ", {"MONGODB_URI": "mongodb://localhost:27017"}):
+        db = Database()
+    return db, client, battles
+
+async def _connect(db: Database, client: MagicMock):
+    with patch("app.database.AsyncMongoClient", return_value=client):
+        await db.connect()
+
+def test_concurrent_saves_are_flushed_in_one_insert_many():
+    db, client, battles = _make_db()
+
+    async def run():
+        await _connect(db, client)
+        await asyncio.gather(*(db.save_battle(_record(str(i))) for i in range(3)))
+        await db.close()
+
+    asyncio.run(run())
+
+    battles.insert_many.assert_awaited_once()
+    documents = battles.insert_many.await_args.args[0]
+    assert [doc["winner"] for doc in documents] == ["0", "1", "2"]
+    client.close.assert_awaited_once()
+
+def test_failed_connect_closes_the_client():
+    db, client, _ = _make_db()
+    client.admin.command.side_effect = ConnectionError("server selection timeout")
+
+    async def run():
+        with pytest.raises(ConnectionError):
+            await _connect(db, client)
+
+    asyncio.run(run())
+
+    client.close.assert_awaited_once()
+    assert db.client is None
+
+@patch("app.database.WRITE_FLUSH_INTERVAL", 60)
+def test_lone_save_is_flushed_without_waiting():
+    db, client, battles = _make_db()
+
+    async def run():
+        await _connect(db, client)
+        # Would time out if the writer held a single record for the flush interval
+        await asyncio.wait_for(db.save_battle(_record("0")), 1)
+        await db.close()
+
+    asyncio.run(run())
+
+    battles.insert_many.assert_awaited_once()
+
+def test_partial_bulk_write_error_only_fails_affected_saves():
+    db, client, battles = _make_db()
+    error = BulkWriteError({"writeErrors": [{"index": 1, "code": 11000, "errmsg": "duplicate key"}]})
+    battles.insert_many.side_effect = error
+
+    async def run():
+        await _connect(db, client)
+        results = await asyncio.gather(
+            *(db.save_battle(_record(str(i))) for i in range(3)), return_exceptions=True
+        )
+        await db.close()
+        return results
+
+    results = asyncio.run(run())
+
+    battles.insert_many.assert_awaited_once()
+    assert results[0] is None and results[2] is None
+    assert results[1] is error
@@ -0,0 +1,34 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+from app.llm_cache import LLMCache, normalize_name
+
+def test_make_key_is_stable_for_normalized_names():
+    key1 = LLMCache.make_key("model", {"fighter": normalize_name("  Goku "), "opponent": normalize_name("Vegeta")})
+    key2 = LLMCache.make_key("model", {"opponent": normalize_name("vegeta"), "fighter": normalize_name("GOKU")})
+    assert key1 == key2
+    assert key1 != LLMCache.make_key("other-model", {"fighter": "goku", "opponent": "vegeta"})
+
+def test_get_or_set_only_calls_factory_on_miss():
+    cache = LLMCache()
+    factory = AsyncMock(return_value="analysis text")
+
+    async def run():
+        first = await cache.get_or_set("key", factory)
+        second = await cache.get_or_set("key", factory)
+        return first, second
+
+    assert asyncio.run(run()) == ("analysis text", "analysis text")
+    factory.assert_awaited_once()
+
+    cache.clear()
+    asyncio.run(cache.get_or_set("key", factory))
+    assert factory.await_count == 2
+
+def test_get_or_set_does_not_cache_empty_values():
+    cache = LLMCache()
+    factory = AsyncMock(side_effect=["", "analysis text"])
+
+    assert asyncio.run(cache.get_or_set("key", factory)) == ""
+    assert asyncio.run(cache.get_or_set("key", factory)) == "analysis text"
+    assert factory.await_count == 2
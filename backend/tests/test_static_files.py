@@ -0,0 +1,44 @@
+import gzip
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.static_files import IMMUTABLE_CACHE_CONTROL, PrecompressedStaticFiles
+
+ASSET_BODY = b"console.log('powerscaler');"
+
+def _client(tmp_path) -> TestClient:
+    (tmp_path / "index-BOwwHLTA.js").write_bytes(ASSET_BODY)
+    (tmp_path / "index-BOwwHLTA.js.gz").write_bytes(gzip.compress(ASSET_BODY))
+    (tmp_path / "vite.svg").write_bytes(b"<svg/>")
+    (tmp_path / "apple-touch-icon.png").write_bytes(b"png")
+    (tmp_path / "my-component.js").write_bytes(ASSET_BODY)
+    (tmp_path / "my-elements.js").write_bytes(ASSET_BODY)
+    (tmp_path / "app-settings.css").write_bytes(b"body{}")
+    app = FastAPI()
+    app.mount("/assets", PrecompressedStaticFiles(directory=tmp_path), name="assets")
+    return TestClient(app)
+
+def test_serves_gzip_variant_when_accepted(tmp_path):
+    response = _client(tmp_path).get("/assets/index-BOwwHLTA.js", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"].startswith("text/javascript")
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert response.content == ASSET_BODY  # httpx transparently decodes the gzip body
+
+def test_falls_back_to_raw_asset(tmp_path):
+    client = _client(tmp_path)
+
+    # A coding refused with q=0 must not be served, even though the variant exists
+    for accept_encoding in ("br", "gzip;q=0, br"):
+        response = client.get("/assets/index-BOwwHLTA.js", headers={"Accept-Encoding": accept_encoding})
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+        assert response.content == ASSET_BODY
+
+    # Unhashed files may change between builds, so they must not be marked immutable
+    for name in ("vite.svg", "apple-touch-icon.png", "my-component.js", "my-elements.js", "app-settings.css"):
+        response = client.get(f"/assets/{name}", headers={"Accept-Encoding": "identity"})
+        assert response.status_code == 200
+        assert "cache-control" not in response.headers
@@ -0,0 +1,7 @@
+import logging
+import pytest
+
+@pytest.fixture(scope="session", autouse=True)
+def _configure_logging():
+    # Configure logging once for the session rather than inside each test
+    logging.basicConfig(level=logging.INFO)
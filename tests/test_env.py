@@ -1,23 +1,21 @@
 import os
+from pathlib import Path
 from dotenv import load_dotenv
 import logging
 
+_ENV_PATH = Path(__file__).resolve().parent.parent / 'backend' / '.env'
+
 def test_env_loading():
-    # Configure logging
-    logging.basicConfig(level=logging.INFO)
     logger = logging.getLogger(__name__)
 
-    # Get the path to .env file
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    backend_dir = os.path.join(current_dir, '..', 'backend')
-    env_path = os.path.join(backend_dir, '.env')
-    
-    logger.info(f"Testing .env loading from: {env_path}")
+    logger.info(f"Testing .env loading from: {_ENV_PATH}")
     logger.info(f"Current working directory: {os.getcwd()}")
-    logger.info(f"Directory contents: {os.listdir(backend_dir)}")
+    # Only scan the directory when someone is actually reading debug output
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Directory contents: {os.listdir(_ENV_PATH.parent)}")
     
     # Try to load the .env file
-    load_dotenv(env_path)
+    load_dotenv(_ENV_PATH)
     
     # Check if GEMINI_API_KEY exists
     api_key = os.getenv("GEMINI_API_KEY")